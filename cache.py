@@ -0,0 +1,142 @@
+"""
+Cache des fragments HTML (fastapi-cache2, backend Redis)
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+from contextlib import suppress
+from datetime import date
+from functools import wraps
+
+from fastapi import Response
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.inmemory import InMemoryBackend
+from fastapi_cache.backends.redis import RedisBackend
+from redis import asyncio as aioredis
+
+# Sans REDIS_URL, cache en mémoire du process (dev)
+REDIS_URL = os.getenv("REDIS_URL", "")
+CACHE_PREFIX = "ie-charge"
+CACHE_EXPIRE = int(os.getenv("CACHE_EXPIRE", "300"))
+
+# L'ETL publie sur ce canal après chaque ingestion pour vider le cache
+INVALIDATE_CHANNEL = f"{CACHE_PREFIX}:invalidate"
+RECONNECT_DELAY = 5
+
+logger = logging.getLogger(__name__)
+
+_redis = None
+_listener: asyncio.Task | None = None
+
+# Caches en mémoire du process placés sous le cache HTML, vidés avec lui
+_invalidation_hooks = []
+
+
+def on_invalidate(hook):
+    """Enregistre une fonction (ex. TTLCache.clear) appelée à chaque invalidation"""
+    _invalidation_hooks.append(hook)
+    return hook
+
+
+async def invalidate():
+    # Caches internes d'abord : sinon une requête concurrente réécrirait
+    # dans le cache HTML un rendu calculé sur des données périmées
+    for hook in _invalidation_hooks:
+        hook()
+    await FastAPICache.clear()
+
+
+async def _listen_invalidations():
+    """Écoute le canal d'invalidation, se réabonne si la connexion Redis tombe"""
+    reconnecting = False
+    while True:
+        pubsub = _redis.pubsub()
+        try:
+            await pubsub.subscribe(INVALIDATE_CHANNEL)
+            if reconnecting:
+                # Des invalidations ont pu être perdues pendant la coupure
+                await invalidate()
+                logger.info("Abonnement %s rétabli, cache vidé", INVALIDATE_CHANNEL)
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    await invalidate()
+        except Exception:
+            logger.exception("Abonnement %s perdu, nouvelle tentative dans %ss", INVALIDATE_CHANNEL, RECONNECT_DELAY)
+            reconnecting = True
+            await asyncio.sleep(RECONNECT_DELAY)
+        finally:
+            with suppress(Exception):
+                await pubsub.close()
+
+
+async def init_cache() -> str:
+    """Initialise le backend de cache, retourne son nom"""
+    global _redis, _listener
+
+    if not REDIS_URL:
+        FastAPICache.init(InMemoryBackend(), prefix=CACHE_PREFIX)
+        return "mémoire"
+
+    _redis = aioredis.from_url(REDIS_URL)
+    FastAPICache.init(RedisBackend(_redis), prefix=CACHE_PREFIX)
+    _listener = asyncio.create_task(_listen_invalidations())
+    return "Redis"
+
+
+async def close_cache():
+    if _listener is not None:
+        _listener.cancel()
+    if _redis is not None:
+        await _redis.close()
+
+
+def _normalize(value) -> str:
+    """Les filtres CSV sont triés : 'A,B' et 'B, A' partagent la même entrée"""
+    if value is None:
+        return ""
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, str):
+        return ",".join(sorted(v.strip() for v in value.split(",") if v.strip()))
+    return str(value)
+
+
+def _build_key(namespace: str, kwargs: dict) -> str:
+    raw = "&".join(f"{k}={_normalize(v)}" for k, v in sorted(kwargs.items()) if k != "request")
+    digest = hashlib.sha1(raw.encode()).hexdigest()
+    return f"{FastAPICache.get_prefix()}:{namespace}:{digest}"
+
+
+def html_cache(namespace: str, expire: int = CACHE_EXPIRE):
+    """
+    Met en cache le corps HTML rendu par un endpoint, indexé sur ses paramètres de requête.
+    On stocke les octets du TemplateResponse (non sérialisable tel quel).
+    Une panne du backend ne fait pas échouer l'endpoint : on rend sans cache.
+    """
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            key = _build_key(namespace, kwargs)
+            backend = FastAPICache.get_backend()
+
+            try:
+                cached = await backend.get(key)
+            except Exception:
+                logger.exception("Lecture du cache %s impossible", namespace)
+                cached = None
+            if cached is not None:
+                return Response(content=cached, media_type="text/html")
+
+            response = await func(*args, **kwargs)
+            if response.status_code == 200:
+                try:
+                    await backend.set(key, response.body, expire)
+                except Exception:
+                    logger.exception("Écriture du cache %s impossible", namespace)
+            return response
+
+        return wrapper
+
+    return decorator
@@ -5,9 +5,16 @@ Connexion MySQL avec pool de connexions SQLAlchemy
 import os
 from datetime import date, timedelta
 from sqlalchemy import create_engine, text
+from sqlalchemy.dialects import mysql
 from sqlalchemy.pool import QueuePool
 import pandas as pd
 
+try:
+    # Lecture MySQL -> colonnes en Rust, sans tuples DB-API (optionnel)
+    import connectorx as cx
+except ImportError:  # pragma: no cover - repli sur pandas.read_sql
+    cx = None
+
 # Configuration DB (à mettre en variables d'environnement en prod)
 DB_CONFIG = {
     "host": os.getenv("DB_HOST", "162.19.251.55"),
@@ -22,6 +29,12 @@ DATABASE_URL = (
     f"@{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}"
 )
 
+# URL pour connectorx (pas de driver SQLAlchemy)
+CONNECTORX_URL = (
+    f"mysql://{DB_CONFIG['user']}:{DB_CONFIG['password']}"
+    f"@{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}"
+)
+
 # Pool de connexions (évite d'ouvrir une connexion par requête)
 engine = create_engine(
     DATABASE_URL,
@@ -62,7 +75,51 @@ def get_date_range() -> dict:
         }
 
 
-def query_df(sql: str, params: dict = None) -> pd.DataFrame:
-    """Exécute une requête et retourne un DataFrame"""
+# paramstyle "named" : pas de doublement des % (propre aux drivers DB-API)
+_LITERAL_DIALECT = mysql.dialect(paramstyle="named")
+
+
+def _render_sql(sql: str, params: dict | None) -> str:
+    """connectorx n'accepte pas de paramètres : valeurs échappées par le dialecte MySQL"""
+    stmt = text(sql)
+    if params:
+        # Comme pd.read_sql, les paramètres absents de la requête sont ignorés
+        names = stmt.compile(dialect=_LITERAL_DIALECT).params
+        stmt = stmt.bindparams(**{k: v for k, v in params.items() if k in names})
+    return str(stmt.compile(dialect=_LITERAL_DIALECT, compile_kwargs={"literal_binds": True}))
+
+
+def _to_numpy_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    connectorx remonte les entiers NULLables en Int64 (masqué) : on revient aux dtypes
+    de pd.read_sql (float64 avec NaN s'il y a des NULL, sinon entier numpy)
+    """
+    for col in df.columns:
+        dtype = df[col].dtype
+        if pd.api.types.is_extension_array_dtype(dtype) and dtype.kind in "iuf":
+            df[col] = df[col].astype("float64" if df[col].hasnans else dtype.numpy_dtype)
+    return df
+
+
+def query_df(
+    sql: str,
+    params: dict = None,
+    dtype_backend: str = None,
+    use_connectorx: bool = False,
+) -> pd.DataFrame:
+    """
+    Exécute une requête et retourne un DataFrame.
+    dtype_backend="pyarrow" : colonnes Arrow (chaînes en large_string au lieu d'objets Python)
+    use_connectorx=True : lecture par connectorx (hors pool, une connexion par appel),
+    à réserver aux lectures de nombreuses lignes brutes ; repli sur pd.read_sql s'il est absent
+    """
+    if use_connectorx and cx is not None:
+        rendered = _render_sql(sql, params)
+        if dtype_backend == "pyarrow":
+            table = cx.read_sql(CONNECTORX_URL, rendered, return_type="arrow")
+            return table.to_pandas(types_mapper=pd.ArrowDtype)
+        return _to_numpy_dtypes(cx.read_sql(CONNECTORX_URL, rendered))
+
+    kwargs = {"dtype_backend": dtype_backend} if dtype_backend else {}
     with engine.connect() as conn:
-        return pd.read_sql(text(sql), conn, params=params)
+        return pd.read_sql(text(sql), conn, params=params, **kwargs)
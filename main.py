@@ -9,15 +9,19 @@ from fastapi.templating import Jinja2Templates
 from contextlib import asynccontextmanager
 
 from db import engine, get_sites, get_date_range
+from cache import init_cache, close_cache
 from routers import defauts, alertes, sessions, kpis, overview, filters
 
-# Lifespan pour initialiser/fermer la connexion DB
+# Lifespan pour initialiser/fermer la connexion DB et le cache
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     print("🚀 Démarrage IE Charge Dashboard")
+    backend = await init_cache()
+    print(f"🗄️  Cache : {backend}")
     yield
     # Shutdown
+    await close_cache()
     engine.dispose()
     print("👋 Arrêt propre")
 
@@ -48,7 +48,7 @@ async def get_filter_options(
           AND (type_erreur IS NOT NULL OR moment IS NOT NULL)
     """
     
-    df = query_df(sql)
+    df = query_df(sql, dtype_backend="pyarrow")
     
     # Options type_erreur
     error_types = []
@@ -80,7 +80,7 @@ async def get_sites():
         WHERE Site IS NOT NULL 
         ORDER BY Site
     """
-    df = query_df(sql)
+    df = query_df(sql, dtype_backend="pyarrow")
     sites = df["Site"].tolist() if not df.empty else []
     
     return JSONResponse({"sites": sites})
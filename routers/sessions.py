@@ -6,10 +6,13 @@ Endpoint: GET /api/sessions/stats
 from fastapi import APIRouter, Request, Query
 from fastapi.templating import Jinja2Templates
 from datetime import date
+from functools import lru_cache
 from urllib.parse import urlencode
+from cachetools import TTLCache, cached
 import pandas as pd
 import numpy as np
 
+from cache import html_cache, on_invalidate
 from db import query_df
 from routers.filters import MOMENT_ORDER
 
@@ -17,44 +20,211 @@ router = APIRouter(tags=["sessions"])
 templates = Jinja2Templates(directory="templates")
 
 
-def _build_conditions(sites: str, date_debut: date | None, date_fin: date | None):
+@lru_cache(maxsize=2048)
+def _parse_csv(value: str) -> tuple[str, ...]:
+    """Découpe un paramètre 'a, b,c' en ('a', 'b', 'c'), mis en cache par valeur"""
+    return tuple(filter(None, (v.strip() for v in value.split(","))))
+
+
+@lru_cache(maxsize=256)
+def _param_names(prefix: str, n: int) -> tuple[str, ...]:
+    return tuple(f"{prefix}_{i}" for i in range(n))
+
+
+def _in_clause(column: str, prefix: str, n: int) -> str:
+    return f"{column} IN ({','.join(':' + name for name in _param_names(prefix, n))})"
+
+
+@lru_cache(maxsize=64)
+def _where_template(has_start: bool, has_end: bool, n_sites: int) -> str:
+    """Texte SQL du WHERE par forme de filtre : seuls les paramètres changent d'une requête à l'autre"""
     conditions = ["1=1"]
-    params = {}
+    if has_start:
+        conditions.append("`Datetime start` >= :date_debut")
+    if has_end:
+        conditions.append("`Datetime start` < DATE_ADD(:date_fin, INTERVAL 1 DAY)")
+    if n_sites:
+        conditions.append(_in_clause("Site", "site", n_sites))
+    return " AND ".join(conditions)
+
+
+def _build_conditions(sites: str, date_debut: date | None, date_fin: date | None):
+    site_list = _parse_csv(sites) if sites else ()
+    params = dict(zip(_param_names("site", len(site_list)), site_list))
 
     if date_debut:
-        conditions.append("`Datetime start` >= :date_debut")
         params["date_debut"] = str(date_debut)
     if date_fin:
-        conditions.append("`Datetime start` < DATE_ADD(:date_fin, INTERVAL 1 DAY)")
         params["date_fin"] = str(date_fin)
-    if sites:
-        site_list = [s.strip() for s in sites.split(",") if s.strip()]
-        if site_list:
-            placeholders = ",".join([f":site_{i}" for i in range(len(site_list))])
-            conditions.append(f"Site IN ({placeholders})")
-            for i, s in enumerate(site_list):
-                params[f"site_{i}"] = s
-
-    return " AND ".join(conditions), params
-
-
-def _apply_status_filters(df: pd.DataFrame, error_type_list: list[str], moment_list: list[str]) -> pd.DataFrame:
-    df["is_ok"] = pd.to_numeric(df["state"], errors="coerce").fillna(0).astype(int).eq(0)
-    mask_nok = ~df["is_ok"]
-    mask_type = (
-        df["type_erreur"].isin(error_type_list)
-        if error_type_list and "type_erreur" in df.columns
-        else pd.Series(True, index=df.index)
-    )
-    mask_moment = (
-        df["moment"].isin(moment_list)
-        if moment_list and "moment" in df.columns
-        else pd.Series(True, index=df.index)
-    )
-    df["is_ok_filt"] = np.where(mask_nok & mask_type & mask_moment, False, True)
+
+    return _where_template(bool(date_debut), bool(date_fin), len(site_list)), params
+
+
+def _is_ok(state: pd.Series) -> np.ndarray:
+    """
+    Comparaison directe state == 0 sans Series intermédiaires.
+    NULL et valeurs non numériques comptent comme OK (équivalent de fillna(0)).
+    """
+    arr = state.to_numpy()
+    if arr.dtype.kind in "biu":
+        return arr == 0
+    if arr.dtype.kind == "f":
+        # Colonne INT contenant des NULL : pandas la remonte en float64
+        return (arr == 0) | np.isnan(arr)
+    return pd.to_numeric(state, errors="coerce").fillna(0).to_numpy() == 0
+
+
+def _in_filter(col: pd.Series, values) -> np.ndarray:
+    """
+    Équivalent de col.isin(values) : le test d'appartenance est fait une fois par
+    valeur distincte, puis appliqué aux lignes par indexation sur les codes factorisés.
+    """
+    codes, uniques = pd.factorize(col)
+    # Code -1 (NaN) -> dernière case, toujours False
+    allowed = np.append(uniques.isin(values), False)
+    return allowed[codes]
+
+
+def _apply_status_filters(
+    df: pd.DataFrame, error_type_list: tuple[str, ...], moment_list: tuple[str, ...]
+) -> pd.DataFrame:
+    is_ok = _is_ok(df["state"])
+    df["is_ok"] = is_ok
+
+    if not error_type_list and not moment_list:
+        # Aucun filtre affectant les NOK (cas de l'arrivée sur le dashboard) : is_ok_filt == is_ok
+        df["match_filt"] = True
+        df["is_ok_filt"] = is_ok
+        return df
+
+    # Correspondance aux filtres Type d'erreur / Moment, calculée une seule fois
+    # (réutilisée par site-details au lieu de refaire les isin)
+    match = np.ones(len(df), dtype=bool)
+    if error_type_list and "type_erreur" in df.columns:
+        match &= _in_filter(df["type_erreur"], error_type_list)
+    if moment_list and "moment" in df.columns:
+        match &= _in_filter(df["moment"], moment_list)
+
+    df["match_filt"] = match
+    df["is_ok_filt"] = is_ok | ~match
     return df
 
 
+@lru_cache(maxsize=64)
+def _nok_template(n_types: int, n_moments: int) -> str:
+    conditions = ["`State of charge(0:good, 1:error)` <> 0"]
+    if n_types:
+        conditions.append(_in_clause("type_erreur", "etype", n_types))
+    if n_moments:
+        conditions.append(_in_clause("moment", "moment", n_moments))
+    return " AND ".join(conditions)
+
+
+def _build_nok_condition(error_type_list: tuple[str, ...], moment_list: tuple[str, ...]):
+    """
+    Équivalent SQL de _apply_status_filters : une session est un échec retenu
+    si elle est NOK et correspond aux filtres Type d'erreur / Moment
+    """
+    params = dict(zip(_param_names("etype", len(error_type_list)), error_type_list))
+    params.update(zip(_param_names("moment", len(moment_list)), moment_list))
+    return _nok_template(len(error_type_list), len(moment_list)), params
+
+
+@lru_cache(maxsize=64)
+def _site_stats_sql(where_clause: str, nok_clause: str) -> str:
+    return f"""
+        SELECT
+            Site,
+            COUNT(*) AS total,
+            SUM(CASE WHEN {nok_clause} THEN 1 ELSE 0 END) AS nok
+        FROM kpi_sessions
+        WHERE {where_clause}
+        GROUP BY Site
+    """
+
+
+def _query_site_stats(where_clause: str, params: dict, nok_clause: str, nok_params: dict) -> pd.DataFrame:
+    """
+    Agrégation par site faite par MySQL (une ligne par site au lieu d'une par session).
+    La ligne Site NULL est conservée pour les totaux globaux.
+    """
+    df = query_df(_site_stats_sql(where_clause, nok_clause), {**params, **nok_params})
+    if df.empty:
+        return df
+
+    # SUM() revient en DECIMAL côté pymysql
+    df["total"] = df["total"].astype(int)
+    df["nok"] = df["nok"].astype(int)
+    df["ok"] = df["total"] - df["nok"]
+    return df
+
+
+@lru_cache(maxsize=64)
+def _err_counts_sql(where_clause: str, nok_clause: str) -> str:
+    return f"""
+        SELECT Site, moment, COUNT(*) AS Nb
+        FROM kpi_sessions
+        WHERE {where_clause} AND {nok_clause}
+        GROUP BY Site, moment
+    """
+
+
+# Vidé par l'invalidation ETL (cache.invalidate), avant le cache HTML
+_aggregates_cache = TTLCache(maxsize=64, ttl=120)
+on_invalidate(_aggregates_cache.clear)
+
+
+@cached(_aggregates_cache)
+def _load_sessions_aggregates(
+    sites: str,
+    date_debut: date | None,
+    date_fin: date | None,
+    error_types: tuple[str, ...],
+    moments: tuple[str, ...],
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Agrégats partagés par /sessions/stats et /sessions/general : au chargement du
+    dashboard les deux endpoints ont les mêmes filtres, MySQL n'est interrogé qu'une fois.
+    Retourne (stats par site, échecs retenus par Site x moment), lus ensemble pour que
+    les colonnes moment du récap restent cohérentes avec Total_NOK.
+    Les DataFrames retournés sont partagés entre requêtes, ne pas les modifier.
+    """
+    where_clause, params = _build_conditions(sites, date_debut, date_fin)
+    nok_clause, nok_params = _build_nok_condition(error_types, moments)
+
+    stats = _query_site_stats(where_clause, params, nok_clause, nok_params)
+    if stats.empty or not stats["nok"].any():
+        return stats, pd.DataFrame(columns=["Site", "moment", "Nb"])
+
+    err_counts = query_df(_err_counts_sql(where_clause, nok_clause), {**params, **nok_params})
+    return stats, err_counts
+
+
+def _site_stats_table(stats: pd.DataFrame) -> pd.DataFrame:
+    stats_site = stats.dropna(subset=["Site"])[["Site", "total", "ok", "nok"]].reset_index(drop=True)
+    stats_site["taux_ok"] = np.where(
+        stats_site["total"] > 0,
+        (stats_site["ok"] / stats_site["total"] * 100).round(1),
+        0,
+    )
+    return stats_site
+
+
+def _count_charges_by(keys: pd.Series, is_ok_filt) -> pd.DataFrame:
+    """
+    Total_Charges / Charges_OK par clé en une passe (pd.factorize + np.bincount).
+    Même résultat qu'un groupby(as_index=False) count/sum : clés triées, NaN exclus.
+    """
+    codes, uniques = pd.factorize(keys, sort=True)
+    valid = codes >= 0
+    codes = codes[valid]
+    ok_weights = np.asarray(is_ok_filt, dtype=np.float64)[valid]
+
+    total = np.bincount(codes, minlength=len(uniques))
+    ok = np.bincount(codes, weights=ok_weights, minlength=len(uniques)).astype(np.int64)
+    return pd.DataFrame({keys.name: uniques, "Total_Charges": total, "Charges_OK": ok})
+
+
 def _comparaison_base_context(
     request: Request,
     filters: dict,
@@ -84,6 +254,7 @@ def _comparaison_base_context(
 
 
 @router.get("/sessions/stats")
+@html_cache("sessions:stats")
 async def get_sessions_stats(
     request: Request,
     sites: str = Query(default=""),
@@ -95,24 +266,12 @@ async def get_sessions_stats(
     """
     Retourne les statistiques globales des sessions (taux réussite, échecs)
     """
-    error_type_list = [e.strip() for e in error_types.split(",") if e.strip()] if error_types else []
-    moment_list = [m.strip() for m in moments.split(",") if m.strip()] if moments else []
+    error_type_list = _parse_csv(error_types)
+    moment_list = _parse_csv(moments)
 
-    where_clause, params = _build_conditions(sites, date_debut, date_fin)
+    stats, _ = _load_sessions_aggregates(sites, date_debut, date_fin, error_type_list, moment_list)
     
-    sql = f"""
-        SELECT
-            Site,
-            `State of charge(0:good, 1:error)` as state,
-            type_erreur,
-            moment
-        FROM kpi_sessions
-        WHERE {where_clause}
-    """
-
-    df = query_df(sql, params)
-    
-    if df.empty:
+    if stats.empty:
         return templates.TemplateResponse(
             "partials/sessions_stats.html",
             {
@@ -126,35 +285,20 @@ async def get_sessions_stats(
             }
         )
 
-    df = _apply_status_filters(df, error_type_list, moment_list)
-
-    total = len(df)
-    ok = int(df["is_ok_filt"].sum())
-    nok = total - ok
+    total = int(stats["total"].sum())
+    nok = int(stats["nok"].sum())
+    ok = total - nok
     taux_reussite = round(ok / total * 100, 1) if total else 0
     taux_echec = round(nok / total * 100, 1) if total else 0
 
     # Stats par site
-    stats_site = (
-        df.groupby("Site")
-        .agg(
-            total=("is_ok_filt", "count"),
-            ok=("is_ok_filt", "sum"),
-        )
-        .reset_index()
-    )
-    stats_site["nok"] = stats_site["total"] - stats_site["ok"]
-    stats_site["taux_ok"] = np.where(
-        stats_site["total"] > 0,
-        (stats_site["ok"] / stats_site["total"] * 100).round(1),
-        0
-    )
+    stats_site = _site_stats_table(stats)
     
     # Top 10 par volume
-    top_sites = stats_site.sort_values("total", ascending=False).head(10)
+    top_sites = stats_site.nlargest(10, "total")
     
     # Top 10 par échecs
-    top_echecs = stats_site.sort_values("nok", ascending=False).head(10)
+    top_echecs = stats_site.nlargest(10, "nok")
     
     return templates.TemplateResponse(
         "partials/sessions_stats.html",
@@ -172,6 +316,7 @@ async def get_sessions_stats(
 
 
 @router.get("/sessions/general")
+@html_cache("sessions:general")
 async def get_sessions_general(
     request: Request,
     sites: str = Query(default=""),
@@ -180,24 +325,12 @@ async def get_sessions_general(
     error_types: str = Query(default=""),
     moments: str = Query(default=""),
 ):
-    error_type_list = [e.strip() for e in error_types.split(",") if e.strip()] if error_types else []
-    moment_list = [m.strip() for m in moments.split(",") if m.strip()] if moments else []
-
-    where_clause, params = _build_conditions(sites, date_debut, date_fin)
+    error_type_list = _parse_csv(error_types)
+    moment_list = _parse_csv(moments)
 
-    sql = f"""
-        SELECT
-            Site,
-            `State of charge(0:good, 1:error)` as state,
-            type_erreur,
-            moment
-        FROM kpi_sessions
-        WHERE {where_clause}
-    """
+    stats, err_counts = _load_sessions_aggregates(sites, date_debut, date_fin, error_type_list, moment_list)
 
-    df = query_df(sql, params)
-
-    if df.empty:
+    if stats.empty:
         return templates.TemplateResponse(
             "partials/sessions_general.html",
             {
@@ -214,28 +347,13 @@ async def get_sessions_general(
             },
         )
 
-    df = _apply_status_filters(df, error_type_list, moment_list)
-
-    total = len(df)
-    ok = int(df["is_ok_filt"].sum())
-    nok = total - ok
+    total = int(stats["total"].sum())
+    nok = int(stats["nok"].sum())
+    ok = total - nok
     taux_reussite = round(ok / total * 100, 1) if total else 0
     taux_echec = round(nok / total * 100, 1) if total else 0
 
-    stats_site = (
-        df.groupby("Site")
-        .agg(
-            total=("is_ok_filt", "count"),
-            ok=("is_ok_filt", "sum"),
-        )
-        .reset_index()
-    )
-    stats_site["nok"] = stats_site["total"] - stats_site["ok"]
-    stats_site["taux_ok"] = np.where(
-        stats_site["total"] > 0,
-        (stats_site["ok"] / stats_site["total"] * 100).round(1),
-        0,
-    )
+    stats_site = _site_stats_table(stats)
 
     stat_global = stats_site.rename(columns={"Site": "Site", "total": "Total", "ok": "Total_OK"})
     stat_global["Total_NOK"] = stat_global["Total"] - stat_global["Total_OK"]
@@ -250,34 +368,24 @@ async def get_sessions_general(
         0,
     )
 
-    err = df[~df["is_ok_filt"]].copy()
-
     recap_columns = []
     recap_rows = []
     moment_distribution = []
     moment_total_errors = 0
 
-    if not err.empty:
+    if nok:
+        # Comptes déjà groupés par MySQL : un unstack suffit, sans pivot/fillna/astype
         err_grouped = (
-            err.groupby(["Site", "moment"])
-            .size()
-            .reset_index(name="Nb")
-            .pivot(index="Site", columns="moment", values="Nb")
-            .fillna(0)
-            .astype(int)
-            .reset_index()
+            err_counts.dropna(subset=["Site", "moment"])
+            .set_index(["Site", "moment"])["Nb"]
+            .unstack(fill_value=0)
         )
 
         moment_cols = [m for m in MOMENT_ORDER if m in err_grouped.columns]
-        moment_cols += [c for c in err_grouped.columns if c not in moment_cols + ["Site"]]
+        moment_cols += [c for c in err_grouped.columns if c not in moment_cols]
 
-        recap = (
-            stat_global
-            .merge(err_grouped, on="Site", how="left")
-            .fillna(0)
-            .sort_values("Total_NOK", ascending=False)
-            .reset_index(drop=True)
-        )
+        # Alignement sur les sites de stat_global (0 pour un site sans échec), reste en int
+        err_by_site = err_grouped.reindex(index=stat_global["Site"], columns=moment_cols, fill_value=0)
 
         recap_columns = [
             "Site",
@@ -286,31 +394,29 @@ async def get_sessions_general(
             "Total_NOK",
         ] + moment_cols + ["% OK", "% NOK"]
 
-        recap = recap[recap_columns]
-
-        numeric_moment_cols = [c for c in moment_cols if c in recap.columns]
-        if numeric_moment_cols:
-            recap[numeric_moment_cols] = recap[numeric_moment_cols].astype(int)
+        recap = (
+            pd.concat([stat_global.reset_index(drop=True), err_by_site.reset_index(drop=True)], axis=1)
+            .sort_values("Total_NOK", ascending=False)
+            .reset_index(drop=True)
+        )[recap_columns]
 
         recap_rows = recap.to_dict("records")
 
         counts_moment = (
-            err.groupby("moment")
-            .size()
+            err_counts.groupby("moment", sort=False)["Nb"]
+            .sum()
             .reindex(MOMENT_ORDER, fill_value=0)
             .reset_index(name="count")
         )
         counts_moment = counts_moment[counts_moment["count"] > 0]
 
-        total_err = len(err)
+        total_err = nok
         moment_total_errors = int(total_err)
+        counts = counts_moment["count"].to_numpy()
+        percents = (counts * (100.0 / total_err)).round(1) if total_err else np.zeros(len(counts))
         moment_distribution = [
-            {
-                "moment": row["moment"],
-                "count": int(row["count"]),
-                "percent": round(row["count"] / total_err * 100, 1) if total_err else 0,
-            }
-            for _, row in counts_moment.iterrows()
+            {"moment": m, "count": int(c), "percent": float(p)}
+            for m, c, p in zip(counts_moment["moment"].to_numpy(), counts, percents)
         ]
 
     return templates.TemplateResponse(
@@ -341,8 +447,8 @@ async def get_sessions_comparaison(
     site_focus: str = Query(default=""),
     month_focus: str = Query(default=""),
 ):
-    error_type_list = [e.strip() for e in error_types.split(",") if e.strip()] if error_types else []
-    moment_list = [m.strip() for m in moments.split(",") if m.strip()] if moments else []
+    error_type_list = _parse_csv(error_types)
+    moment_list = _parse_csv(moments)
 
     filters = {
         "sites": sites,
@@ -354,19 +460,21 @@ async def get_sessions_comparaison(
 
     where_clause, params = _build_conditions(sites, date_debut, date_fin)
 
+    # type_erreur / moment ne servent qu'aux filtres : on ne les remonte que si besoin
+    select_cols = ["Site", "`Datetime start`", "`State of charge(0:good, 1:error)` as state"]
+    if error_type_list:
+        select_cols.append("type_erreur")
+    if moment_list:
+        select_cols.append("moment")
+
     sql = f"""
-        SELECT
-            Site,
-            `Datetime start`,
-            `State of charge(0:good, 1:error)` as state,
-            type_erreur,
-            moment
+        SELECT {", ".join(select_cols)}
         FROM kpi_sessions
         WHERE {where_clause}
     """
 
     try:
-        df = query_df(sql, params)
+        df = query_df(sql, params, use_connectorx=True)
     except Exception as exc:  # pragma: no cover - defensive fallback for UI visibility
         return templates.TemplateResponse(
             "partials/sessions_comparaison.html",
@@ -392,13 +500,7 @@ async def get_sessions_comparaison(
 
     site_col = "Site"
 
-    by_site = (
-        df.groupby(site_col, as_index=False)
-        .agg(
-            Total_Charges=("is_ok_filt", "count"),
-            Charges_OK=("is_ok_filt", "sum"),
-        )
-    )
+    by_site = _count_charges_by(df[site_col], df["is_ok_filt"])
     by_site["Charges_NOK"] = by_site["Total_Charges"] - by_site["Charges_OK"]
     by_site["% Réussite"] = np.where(
         by_site["Total_Charges"].gt(0),
@@ -416,80 +518,68 @@ async def get_sessions_comparaison(
     by_site_sorted = by_site.sort_values("Total_Charges", ascending=False)
     max_total = int(by_site_sorted["Total_Charges"].max()) if not by_site_sorted.empty else 0
 
+    sorted_sites = by_site_sorted[site_col].tolist()
+
     count_bars = [
-        {
-            "site": row[site_col],
-            "ok": int(row["Charges_OK"]),
-            "nok": int(row["Charges_NOK"]),
-            "total": int(row["Total_Charges"]),
-        }
-        for _, row in by_site_sorted.iterrows()
+        {"site": site, "ok": int(ok), "nok": int(nok), "total": int(total)}
+        for site, ok, nok, total in zip(
+            sorted_sites,
+            by_site_sorted["Charges_OK"].to_numpy(),
+            by_site_sorted["Charges_NOK"].to_numpy(),
+            by_site_sorted["Total_Charges"].to_numpy(),
+        )
     ]
 
     percent_bars = [
-        {
-            "site": row[site_col],
-            "ok_pct": float(row["% Réussite"]),
-            "nok_pct": float(row["% Échec"]),
-        }
-        for _, row in by_site_sorted.iterrows()
+        {"site": site, "ok_pct": float(ok_pct), "nok_pct": float(nok_pct)}
+        for site, ok_pct, nok_pct in zip(
+            sorted_sites,
+            by_site_sorted["% Réussite"].to_numpy(),
+            by_site_sorted["% Échec"].to_numpy(),
+        )
     ]
 
-    base = df.copy()
-    base["hour"] = pd.to_datetime(base["Datetime start"], errors="coerce").dt.hour
-
-    g = (
-        base.dropna(subset=["hour"])
-        .groupby([site_col, "hour"])
-        .size()
-        .reset_index(name="Nb")
-    )
-
     peak_rows = []
     heatmap_rows = []
     heatmap_hours: list[int] = []
     heatmap_max = 0
 
-    if not g.empty:
-        peak = g.loc[g.groupby(site_col)["Nb"].idxmax()][[site_col, "hour", "Nb"]].rename(
-            columns={"hour": "Heure de pic", "Nb": "Nb au pic"}
-        )
+    # Matrice Site x heure remplie en une passe (np.add.at), sans groupby/pivot/fillna
+    site_codes, site_index = pd.factorize(df[site_col], sort=True)
+    hours = df["Datetime start"].dt.hour.to_numpy(dtype=np.float64)
+    valid = (site_codes >= 0) & ~np.isnan(hours)
+    counts = np.zeros((len(site_index), 24), dtype=np.int64)
+    np.add.at(counts, (site_codes[valid], hours[valid].astype(np.intp)), 1)
 
-        def _w_median_hours(dfh: pd.DataFrame) -> int:
-            s = dfh.sort_values("hour")
-            c = s["Nb"].cumsum()
-            half = s["Nb"].sum() / 2.0
-            return int(s.loc[c >= half, "hour"].iloc[0])
+    site_totals = counts.sum(axis=1)
+    active_sites = np.flatnonzero(site_totals)
 
-        med = (
-            g.groupby(site_col)[["hour", "Nb"]]
-            .apply(_w_median_hours)
-            .reset_index(name="Heure médiane")
-        )
-        summ = peak.merge(med, on=site_col, how="left")
+    if active_sites.size:
+        peak_hours = counts.argmax(axis=1)
+        # Heure médiane pondérée : première heure où le cumul atteint la moitié des charges
+        median_hours = (counts.cumsum(axis=1) >= site_totals[:, None] / 2.0).argmax(axis=1)
 
-        for _, row in summ.sort_values(site_col).iterrows():
+        for i in active_sites:
             peak_rows.append(
                 {
-                    "site": row[site_col],
-                    "peak_hour": f"{int(row['Heure de pic']):02d}:00",
-                    "peak_nb": int(row["Nb au pic"]),
-                    "median_hour": f"{int(row['Heure médiane']):02d}:00",
+                    "site": site_index[i],
+                    "peak_hour": f"{int(peak_hours[i]):02d}:00",
+                    "peak_nb": int(counts[i, peak_hours[i]]),
+                    "median_hour": f"{int(median_hours[i]):02d}:00",
                 }
             )
 
-        heatmap = g.pivot(index=site_col, columns="hour", values="Nb").fillna(0)
-        heatmap_hours = sorted(heatmap.columns.tolist())
-        heatmap_max = int(heatmap.values.max()) if heatmap.size else 0
-        for idx in heatmap.index:
+        heatmap_hours = np.flatnonzero(counts.sum(axis=0)).tolist()
+        heatmap_max = int(counts.max())
+        for i in active_sites:
             heatmap_rows.append(
                 {
-                    "site": idx,
-                    "values": [int(heatmap.at[idx, h]) if h in heatmap.columns else 0 for h in heatmap_hours],
+                    "site": site_index[i],
+                    "values": counts[i, heatmap_hours].tolist(),
                 }
             )
 
-    site_options = by_site_sorted[site_col].tolist()
+    site_options = sorted_sites
     site_focus_value = site_focus if site_focus and site_focus in site_options else (site_options[0] if site_options else "")
 
     monthly_rows = []
@@ -498,15 +588,14 @@ async def get_sessions_comparaison(
     month_focus_value = ""
 
     if site_focus_value:
-        base_site = base[base[site_col] == site_focus_value].copy()
-        ok_focus = base_site[base_site["is_ok_filt"]].copy()
-        nok_focus = base_site[~base_site["is_ok_filt"]].copy()
+        # Seules les deux colonnes utiles sont extraites, le mois est calculé une fois
+        base_site = df.loc[df[site_col] == site_focus_value, ["Datetime start", "is_ok_filt"]]
+        base_site = base_site.assign(month=base_site["Datetime start"].dt.to_period("M").astype(str))
+        ok_focus = base_site[base_site["is_ok_filt"]]
+        nok_focus = base_site[~base_site["is_ok_filt"]]
 
-        ok_focus["month"] = pd.to_datetime(ok_focus["Datetime start"], errors="coerce").dt.to_period("M").astype(str)
-        nok_focus["month"] = pd.to_datetime(nok_focus["Datetime start"], errors="coerce").dt.to_period("M").astype(str)
-
-        g_ok_m = ok_focus.groupby("month").size().reset_index(name="Nb").assign(Status="OK")
-        g_nok_m = nok_focus.groupby("month").size().reset_index(name="Nb").assign(Status="NOK")
+        g_ok_m = ok_focus.groupby("month", sort=False).size().reset_index(name="Nb").assign(Status="OK")
+        g_nok_m = nok_focus.groupby("month", sort=False).size().reset_index(name="Nb").assign(Status="NOK")
 
         g_both_m = pd.concat([g_ok_m, g_nok_m], ignore_index=True)
         g_both_m["month"] = pd.to_datetime(g_both_m["month"], errors="coerce")
@@ -534,19 +623,16 @@ async def get_sessions_comparaison(
                 )
 
             if month_focus_value:
-                ok_month = ok_focus[ok_focus["month"] == month_focus_value].copy()
-                nok_month = nok_focus[nok_focus["month"] == month_focus_value].copy()
-
-                ok_month["day"] = pd.to_datetime(ok_month["Datetime start"], errors="coerce").dt.strftime("%Y-%m-%d")
-                nok_month["day"] = pd.to_datetime(nok_month["Datetime start"], errors="coerce").dt.strftime("%Y-%m-%d")
+                ok_day = ok_focus.loc[ok_focus["month"] == month_focus_value, "Datetime start"].dt.strftime("%Y-%m-%d")
+                nok_day = nok_focus.loc[nok_focus["month"] == month_focus_value, "Datetime start"].dt.strftime("%Y-%m-%d")
 
                 per = pd.Period(month_focus_value, freq="M")
                 days = pd.date_range(per.to_timestamp(how="start"), per.to_timestamp(how="end"), freq="D").strftime("%Y-%m-%d")
 
-                g_ok_d = ok_month.groupby("day").size().reindex(days, fill_value=0).reset_index()
+                g_ok_d = ok_day.value_counts().reindex(days, fill_value=0).reset_index()
                 g_ok_d.columns = ["day", "Nb"]
                 g_ok_d["Status"] = "OK"
-                g_nok_d = nok_month.groupby("day").size().reindex(days, fill_value=0).reset_index()
+                g_nok_d = nok_day.value_counts().reindex(days, fill_value=0).reset_index()
                 g_nok_d.columns = ["day", "Nb"]
                 g_nok_d["Status"] = "NOK"
 
@@ -620,8 +706,8 @@ async def get_sessions_site_details(
     site_focus: str = Query(default=""),
     pdc: str = Query(default=""),
 ):
-    error_type_list = [e.strip() for e in error_types.split(",") if e.strip()] if error_types else []
-    moment_list = [m.strip() for m in moments.split(",") if m.strip()] if moments else []
+    error_type_list = _parse_csv(error_types)
+    moment_list = _parse_csv(moments)
 
     where_clause, params = _build_conditions(sites, date_debut, date_fin)
 
@@ -645,7 +731,7 @@ async def get_sessions_site_details(
         WHERE {where_clause}
     """
 
-    df = query_df(sql, params)
+    df = query_df(sql, params, use_connectorx=True)
 
     if df.empty:
         return templates.TemplateResponse(
@@ -654,18 +740,16 @@ async def get_sessions_site_details(
         )
 
     df["PDC"] = df["PDC"].astype(str)
-    df["is_ok"] = pd.to_numeric(df["state"], errors="coerce").fillna(0).astype(int).eq(0)
-
-    mask_type = df["type_erreur"].isin(error_type_list) if error_type_list and "type_erreur" in df.columns else True
-    mask_moment = df["moment"].isin(moment_list) if moment_list and "moment" in df.columns else True
-    mask_nok = ~df["is_ok"]
-    mask_filtered_error = mask_nok & mask_type & mask_moment
-    df["is_ok_filt"] = np.where(mask_filtered_error, False, True)
+    # Peu de valeurs distinctes : comparaisons et factorize sur codes entiers.
+    # type_erreur / moment restent en objets : affichés tels quels (None) et utilisés
+    # comme libellés des tableaux pivot.
+    df["Site"] = df["Site"].astype("category")
+    df = _apply_status_filters(df, error_type_list, moment_list)
 
     site_options = sorted(df["Site"].dropna().unique().tolist())
     site_value = site_focus if site_focus in site_options else (site_options[0] if site_options else "")
 
-    df_site = df[df["Site"] == site_value].copy()
+    df_site = df[df["Site"] == site_value]
     if df_site.empty:
         return templates.TemplateResponse(
             "partials/sessions_site_details.html",
@@ -680,22 +764,12 @@ async def get_sessions_site_details(
         )
 
     pdc_options = sorted(df_site["PDC"].dropna().unique().tolist())
-    selected_pdc = [p.strip() for p in pdc.split(",") if p.strip()] if pdc else pdc_options
+    selected_pdc = _parse_csv(pdc) if pdc else pdc_options
     selected_pdc = [p for p in selected_pdc if p in pdc_options] or pdc_options
 
-    df_site = df_site[df_site["PDC"].isin(selected_pdc)].copy()
+    df_site = df_site[df_site["PDC"].isin(selected_pdc)]
 
-    mask_type_site = (
-        df_site["type_erreur"].isin(error_type_list)
-        if error_type_list and "type_erreur" in df_site.columns
-        else pd.Series(True, index=df_site.index)
-    )
-    mask_moment_site = (
-        df_site["moment"].isin(moment_list)
-        if moment_list and "moment" in df_site.columns
-        else pd.Series(True, index=df_site.index)
-    )
-    df_filtered = df_site[mask_type_site & mask_moment_site].copy()
+    df_filtered = df_site[df_site["match_filt"]].copy()
 
     for col in ["Datetime start", "Datetime end"]:
         if col in df_filtered.columns:
@@ -740,10 +814,8 @@ async def get_sessions_site_details(
     if "Datetime start" in ok_table.columns:
         ok_table = ok_table.sort_values("Datetime start", ascending=False)
 
-    by_pdc = (
-        df_site.groupby("PDC", as_index=False)
-        .agg(Total_Charges=("is_ok_filt", "count"), Charges_OK=("is_ok_filt", "sum"))
-        .assign(Charges_NOK=lambda d: d["Total_Charges"] - d["Charges_OK"])
+    by_pdc = _count_charges_by(df_site["PDC"], df_site["is_ok_filt"]).assign(
+        Charges_NOK=lambda d: d["Total_Charges"] - d["Charges_OK"]
     )
     by_pdc["% Réussite"] = np.where(
         by_pdc["Total_Charges"].gt(0),
@@ -752,7 +824,7 @@ async def get_sessions_site_details(
     )
     by_pdc = by_pdc.sort_values(["% Réussite", "PDC"], ascending=[True, True])
 
-    err_evi = err_rows[err_rows["type_erreur"] == "Erreur_EVI"].copy() if not err_rows.empty else pd.DataFrame()
+    err_evi = err_rows[err_rows["type_erreur"] == "Erreur_EVI"] if not err_rows.empty else pd.DataFrame()
     evi_moment: list[dict] = []
     evi_moment_grouped: list[dict] = []
     if not err_evi.empty and "moment" in err_evi.columns:
@@ -798,7 +870,7 @@ async def get_sessions_site_details(
 
             if not sub.empty:
                 sub["Code_PC"] = pd.to_numeric(sub["Downstream Code PC"], errors="coerce").fillna(0).astype(int)
-                tmp = sub.groupby(["Code_PC", "moment"]).size().reset_index(name="Occurrences")
+                tmp = sub.groupby(["Code_PC", "moment"], sort=False).size().reset_index(name="Occurrences")
                 downstream_moments = [m for m in MOMENT_ORDER if m in tmp["moment"].unique()]
                 downstream_moments += [m for m in sorted(tmp["moment"].unique()) if m not in downstream_moments]
 
@@ -846,7 +918,7 @@ async def get_sessions_site_details(
 
             if not sub.empty:
                 sub["EVI_Code"] = pd.to_numeric(sub["EVI Error Code"], errors="coerce").astype(int)
-                tmp = sub.groupby(["EVI_Code", "moment"]).size().reset_index(name="Occurrences")
+                tmp = sub.groupby(["EVI_Code", "moment"], sort=False).size().reset_index(name="Occurrences")
                 evi_occ_moments = [m for m in MOMENT_ORDER if m in tmp["moment"].unique()]
                 evi_occ_moments += [m for m in sorted(tmp["moment"].unique()) if m not in evi_occ_moments]
 
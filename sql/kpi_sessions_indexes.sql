@@ -0,0 +1,24 @@
+-- Index de kpi_sessions pour les endpoints /api/sessions/*
+--
+-- Tous les endpoints filtrent sur une plage de `Datetime start` et souvent sur Site.
+-- MySQL n'a pas de clause INCLUDE : les colonnes lues par les agrégats de
+-- /sessions/stats et /sessions/general sont ajoutées en fin de clé pour que l'index
+-- soit couvrant (pas d'accès à la table).
+-- Si type_erreur / moment sont des TEXT, indiquer une longueur de préfixe, ex. type_erreur(64).
+
+CREATE INDEX idx_kpi_sessions_dt_site
+    ON kpi_sessions (
+        `Datetime start`,
+        Site,
+        `State of charge(0:good, 1:error)`,
+        type_erreur,
+        moment
+    );
+
+-- Vérification : type=range, key=idx_kpi_sessions_dt_site, Extra "Using index"
+-- EXPLAIN
+-- SELECT Site, COUNT(*) AS total,
+--        SUM(CASE WHEN `State of charge(0:good, 1:error)` <> 0 THEN 1 ELSE 0 END) AS nok
+-- FROM kpi_sessions
+-- WHERE `Datetime start` >= '2024-01-01' AND `Datetime start` < '2024-02-01'
+-- GROUP BY Site;